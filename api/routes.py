@@ -1,8 +1,10 @@
+import json
 import os
 import uuid
 from contextlib import asynccontextmanager
 
-from fastapi import APIRouter, Query, HTTPException, FastAPI
+from fastapi import APIRouter, Query, HTTPException, FastAPI, Request
+from fastapi.responses import StreamingResponse
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import AzureChatOpenAI
 from pydantic import SecretStr
@@ -10,19 +12,117 @@ from pydantic import SecretStr
 from api.actions import suggest_actions
 from scraper.page_scraper import crawl_website, read_all_scraped_pages_text
 from utils.page_utils import BASE_SCRAPED_DATA_DIR, get_pages_dir, get_url_page_dir, slugify
-from vectorstore.embedding import load_vector_store, create_and_save_vector_store
+from vectorstore.answer_cache import get_exact_cached_answer, get_similar_cached_answer, store_answer
+from vectorstore.embedding import load_vector_store, create_and_save_vector_store, get_embeddings, \
+    is_current_vector_store
+from vectorstore.retrieval import batched_similarity_search
 
 router = APIRouter()
 
+
+def _create_answer_chain():
+    """
+    Builds the prompt | LLM chain used to answer queries. Created once at startup
+    and shared by every /query request.
+    """
+    # Ensure OpenAI API key is available for the LLM call
+    api_key = os.getenv("CHAT_MODEL_KEY")
+    if not api_key:
+        raise ValueError("CHAT_MODEL_KEY environment variable not set for LLM.")
+
+    # Initialize the ChatOpenAI model
+    # Using "o4-mini" as a common and cost-effective model.
+    llm = AzureChatOpenAI(
+        azure_deployment=os.getenv("CHAT_MODEL_NAME"),
+        azure_endpoint=os.getenv("CHAT_MODEL_URL"),
+        api_key=SecretStr(api_key),
+        api_version=os.getenv("CHAT_MODEL_VERSION"),
+        model="o4-mini",
+        temperature=0.7
+    )
+
+    # Define the prompt template for the LLM
+    # This template guides the LLM on how to use the provided context and answer the question.
+    prompt_template = ChatPromptTemplate.from_messages(
+        [
+            ("system", "You are an AI assistant tasked with answering questions based ONLY on the provided context. "
+                       "If the answer is not explicitly available in the context, state that you don't have enough information. "
+                       "Do not make up information."),
+            ("human", "Context: {context}\n\nQuestion: {query}"),
+        ]
+    )
+
+    # The chain pipes the output of the prompt template into the LLM.
+    return prompt_template | llm
+
+
+def _sse_event(data, event: str | None = None) -> str:
+    """
+    Formats a server-sent event. The payload is JSON-encoded so answer text
+    containing newlines stays within a single SSE data field.
+    """
+    event_line = f"event: {event}\n" if event else ""
+    return f"{event_line}data: {json.dumps(data)}\n\n"
+
+
+async def _stream_cached_answer(response: dict):
+    """
+    Replays a cached answer in the same event format as a freshly generated one.
+    """
+    yield _sse_event(response["answer"])
+    yield _sse_event(response["actions"], event="actions")
+
+
+async def _stream_answer(answer_chain, scrape_id: str, vectorstore, query: str, query_embedding: list[float],
+                         context_text: str):
+    """
+    Streams the answer as it is generated, then sends the suggested actions
+    (computed from the complete answer) as a final 'actions' event.
+    """
+    answer_parts = []
+
+    try:
+        async for chunk in answer_chain.astream({"context": context_text, "query": query}):
+            if chunk.content:
+                answer_parts.append(chunk.content)
+                yield _sse_event(chunk.content)
+
+    except Exception as e:
+        # The response has already started, so the error is reported in-stream
+        print(f"Error while streaming answer for scrape_id {scrape_id}: {e}")
+        yield _sse_event({"detail": f"Failed to process query: {e}"}, event="error")
+        return
+
+    answer = "".join(answer_parts)
+
+    # Suggest actions based on query and answer
+    actions = suggest_actions(query, answer)
+
+    # Don't cache an answer built from a vector store that was rebuilt while it streamed
+    if is_current_vector_store(scrape_id, vectorstore):
+        store_answer(scrape_id, query, query_embedding, {"answer": answer, "actions": actions})
+
+    yield _sse_event(actions, event="actions")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Context manager for managing the lifespan of the FastAPI application.
-    Ensures the base scraped data directory exists on startup.
+    Ensures the base scraped data directory exists and builds the shared
+    answer chain on startup.
     """
     os.makedirs(BASE_SCRAPED_DATA_DIR, exist_ok=True)
     print(f"Base scraped data directory '{BASE_SCRAPED_DATA_DIR}' ensured to exist.")
 
+    try:
+        app.state.answer_chain = _create_answer_chain()
+        print("Answer chain initialized.")
+    except Exception as e:
+        # Scraping still works without the LLM; /query reports the failure with a 503
+        app.state.answer_chain = None
+        print(f"Failed to initialize the answer chain: {e}")
+
     yield # Application starts here
     # Code after yield will run on shutdown (e.g., for cleanup)
     print("FastAPI application shutting down.")
@@ -140,6 +240,7 @@ async def update_vector(
     summary="Query the scraped website content using a specific scrape ID"
 )
 async def answer_query_endpoint(
+        request: Request,
         query: str = Query(
             ...,
             examples=["What is the main topic of this website?"]
@@ -150,7 +251,8 @@ async def answer_query_endpoint(
         )):
     """
     Endpoint to answer questions based on the locally stored vector database
-    of the previously scraped website.
+    of the previously scraped website. The answer is streamed as server-sent
+    events, followed by an 'actions' event with the suggested actions.
     """
     if not scrape_id:
         raise HTTPException(status_code=400, detail="'scrape_id' field is required in the request body.")
@@ -158,62 +260,42 @@ async def answer_query_endpoint(
     if not query:
         raise HTTPException(status_code=400, detail="'query' field is required in the request body.")
 
+    answer_chain = request.app.state.answer_chain
+    if answer_chain is None:
+        raise HTTPException(status_code=503, detail="The language model is not available. Check the chat model configuration.")
+
     print(f"Received query: '{query}' for scrape_id: {scrape_id}")
     try:
         # Load the specific vector store for the given scrape_id
         current_vector_store = await load_vector_store(scrape_id)
 
-        # Step 1: Retrieve relevant documents (text chunks) from the vector store
-        retriever = current_vector_store.as_retriever()
-        docs = await retriever.ainvoke(query)
-
-        # Combine the content of the retrieved documents to form the context for the LLM
-        context_text = "\n\n".join([doc.page_content for doc in docs])
-        print(f"Retrieved {len(docs)} relevant document(s) for scrape_id {scrape_id}.")
-
-        # Ensure OpenAI API key is available for the LLM call
-        api_key = os.getenv("CHAT_MODEL_KEY")
-        if not api_key:
-            raise ValueError("API_KEY environment variable not set for LLM.")
-
-        # Step 2: Initialize the ChatOpenAI model
-        # Using "o4-mini" as a common and cost-effective model.
-        llm = AzureChatOpenAI(
-            azure_deployment=os.getenv("CHAT_MODEL_NAME"),
-            azure_endpoint=os.getenv("CHAT_MODEL_URL"),
-            api_key=SecretStr(api_key),
-            api_version=os.getenv("CHAT_MODEL_VERSION"),
-            model="o4-mini",
-            temperature=0.7
-        )
+        # Return a cached answer for the same query without embedding it
+        cached_response = get_exact_cached_answer(scrape_id, query)
 
-        # Step 3: Define the prompt template for the LLM
-        # This template guides the LLM on how to use the provided context and answer the question.
-        prompt_template = ChatPromptTemplate.from_messages(
-            [
-                ("system", "You are an AI assistant tasked with answering questions based ONLY on the provided context. "
-                           "If the answer is not explicitly available in the context, state that you don't have enough information. "
-                           "Do not make up information."),
-                ("human", "Context: {context}\n\nQuestion: {query}"),
-            ]
-        )
+        if cached_response is None:
+            # Step 1: Embed the query once; it is used for both the semantic cache and retrieval
+            query_embedding = await get_embeddings().aembed_query(query)
 
-        # Step 4: Create a LangChain chain to combine prompt and LLM
-        # The chain pipes the output of the prompt template into the LLM.
-        chain = prompt_template | llm
+            # Return a cached answer for a semantically similar query
+            cached_response = get_similar_cached_answer(scrape_id, query_embedding)
 
-        # Step 5: Invoke the chain to get the answer from the LLM
-        response = await chain.ainvoke({"context": context_text, "query": query})
+        if cached_response is not None:
+            print(f"Answer for query '{query}' served from cache for scrape_id {scrape_id}.")
+            return StreamingResponse(_stream_cached_answer(cached_response), media_type="text/event-stream")
 
-        answer = response.content
+        # Step 2: Retrieve relevant documents (text chunks) from the vector store,
+        # batched with any other queries arriving concurrently for the same store
+        docs = await batched_similarity_search(current_vector_store, query_embedding)
 
-        # Suggest actions based on query and answer
-        actions = suggest_actions(query, answer)
+        # Combine the content of the retrieved documents to form the context for the LLM
+        context_text = "\n\n".join([doc.page_content for doc in docs])
+        print(f"Retrieved {len(docs)} relevant document(s) for scrape_id {scrape_id}.")
 
-        return {
-            "answer": answer,
-            "actions": actions,
-        }
+        # Step 3: Stream the answer from the shared chain as it is generated
+        return StreamingResponse(
+            _stream_answer(answer_chain, scrape_id, current_vector_store, query, query_embedding, context_text),
+            media_type="text/event-stream"
+        )
 
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=f"Scraped data for ID '{scrape_id}' not found. Please scrape it first. Error: {e}")
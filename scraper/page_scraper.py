@@ -1,26 +1,42 @@
 import asyncio
 import os
 import uuid
-from collections import deque
 from urllib.parse import urlparse
 
-import html2text
+import aiofiles
 import httpx
-from bs4 import BeautifulSoup
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selectolax.lexbor import LexborHTMLParser
 
-from utils.page_utils import get_pages_dir, clean_html_content, slugify, get_url_page_dir
-from utils.url_utils import get_domain, normalize_url, extract_text_from_pdf_url
+from utils.page_utils import get_pages_dir, clean_html_content, slugify, get_url_page_dir, parse_html
+from utils.url_utils import get_domain, normalize_url, extract_text_from_pdf_url, get_http_client, \
+    get_url_extension, MEDIA_EXTENSIONS
 from utils.web_driver_utils import get_web_driver
 
+# Number of concurrent crawl workers; each owns its own Selenium driver when one is needed
+CRAWL_WORKERS = min(8, (os.cpu_count() or 1) * 2)
 
-def _scrape_html_page(driver, url: str) -> BeautifulSoup | None:
+# Pages with less visible text than this are assumed to be rendered client-side
+MIN_STATIC_TEXT_LENGTH = 200
+
+# Elements that start a new line of text; all other elements are joined inline
+_BLOCK_TAGS = frozenset({
+    "address", "article", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "figure",
+    "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol",
+    "p", "pre", "section", "table", "td", "th", "tr", "ul"
+})
+
+# Marks the end of a block element while walking the tree
+_END_OF_BLOCK = object()
+
+
+def _scrape_html_page(driver, url: str) -> LexborHTMLParser | None:
     """
     Fetches the fully rendered HTML content of a single page using Selenium
-    and returns a BeautifulSoup object. This is a synchronous function.
+    and returns a parsed Lexbor HTML tree. This is a synchronous function.
     """
     try:
         driver.get(url)
@@ -30,38 +46,113 @@ def _scrape_html_page(driver, url: str) -> BeautifulSoup | None:
         )
 
         html_content = driver.page_source
-        return BeautifulSoup(html_content, 'html.parser')
+        return parse_html(html_content)
 
     except Exception as e:
         print(f"Error scraping HTML page {url} with Selenium: {e}")
         return None
 
 
-def _extract_text_from_html(soup: BeautifulSoup) -> str:
+async def _fetch_html_page(client: httpx.AsyncClient, url: str) -> tuple[str, str]:
+    """
+    Fetches a page over plain HTTP without a browser. Only the response headers are
+    read for non-HTML content, so binary documents are not downloaded here.
+    Returns the content type and the HTML text (empty for non-HTML content).
+    """
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "").lower()
+
+        # A response without a content type is treated as HTML rather than dropped
+        if content_type and "html" not in content_type:
+            return content_type, ""
+
+        await response.aread()
+        return content_type, response.text
+
+
+def _needs_js_rendering(tree: LexborHTMLParser, text: str) -> bool:
     """
-    Extracts text content from the entire body of a BeautifulSoup object.
+    Heuristically decides whether a statically fetched page relies on JavaScript
+    to render its content, i.e. whether it has near-empty extracted text. Many
+    server-rendered pages carry a <noscript> JavaScript notice too, so a notice
+    only matters in that its own text does not count as page content.
     """
-    if not soup or not soup.body:
+    if not tree.body:
+        return True
+
+    text_length = len(text.strip())
+
+    for noscript in tree.body.css("noscript"):
+        notice = noscript.text()
+        if "javascript" in notice.lower():
+            text_length -= len(notice.strip())
+
+    return text_length < MIN_STATIC_TEXT_LENGTH
+
+
+def _extract_text_from_html(tree: LexborHTMLParser) -> str:
+    """
+    Extracts text content from the entire body of a parsed HTML tree.
+    """
+    if not tree or not tree.body:
         return ""
 
-    main_content_element = clean_html_content(soup)
+    main_content_element = clean_html_content(tree)
 
     if not main_content_element:
         return ""
 
-    return html2text.html2text(str(soup.body))
+    return _block_text(main_content_element)
 
 
-def _process_content_and_store(url: str, markdown: str, text_splitter: RecursiveCharacterTextSplitter,
-                               all_scraped_texts: list, url_dir: str):
+def _block_text(root) -> str:
+    """
+    Extracts the text under a node with one line per block element. Inline text
+    (links, emphasis, ...) stays on its block's line with whitespace collapsed,
+    while <pre> blocks keep their original line breaks.
+    """
+    lines = []
+    inline_parts = []
+
+    def end_line():
+        line = " ".join("".join(inline_parts).split())
+        if line:
+            lines.append(line)
+        inline_parts.clear()
+
+    # Iterative depth-first walk, so deeply nested pages can't hit the recursion limit
+    stack = [root]
+    while stack:
+        node = stack.pop()
+
+        if node is _END_OF_BLOCK:
+            end_line()
+        elif node.tag == "-text":
+            inline_parts.append(node.text_content or "")
+        elif node.tag == "pre":
+            end_line()
+            lines.append(node.text().strip("\n"))
+        else:
+            if node.tag in _BLOCK_TAGS:
+                end_line()
+                stack.append(_END_OF_BLOCK)
+            stack.extend(reversed(list(node.iter(include_text=True))))
+
+    end_line()
+    return "\n".join(lines)
+
+
+async def _process_content_and_store(url: str, page_text: str, text_splitter: RecursiveCharacterTextSplitter,
+                                     all_scraped_texts: list, url_dir: str):
     """
     Splits text content into chunks, adds to the main list, and saves to a local file.
     """
-    if not markdown.strip():
+    if not page_text.strip():
         print(f"No meaningful text extracted from {url}. Skipping for embedding.")
         return
 
-    chunks = text_splitter.split_text(markdown)
+    chunks = text_splitter.split_text(page_text)
     all_scraped_texts.extend(chunks)
 
     # Generate filename based on URL
@@ -74,103 +165,182 @@ def _process_content_and_store(url: str, markdown: str, text_splitter: Recursive
 
     page_filename = os.path.join(url_dir, f"{filename_base}.md")
 
-    with open(page_filename, "w", encoding="utf-8") as f:
-        f.write(markdown)
+    # Write asynchronously so other workers keep fetching while the file is saved
+    async with aiofiles.open(page_filename, "w", encoding="utf-8") as f:
+        await f.write(page_text)
     print(f"Saved content for {url} to {page_filename}")
 
 
-def _extract_and_queue_links(soup: BeautifulSoup, current_url: str, base_domain: str, visited_urls: set,
-                             urls_to_visit: deque):
+def _extract_and_queue_links(tree: LexborHTMLParser, current_url: str, base_domain: str, visited_urls: set,
+                             urls_to_visit: asyncio.Queue):
     """
-    Extracts internal links from a BeautifulSoup object and adds them to the queue if not visited.
+    Extracts internal links from a parsed HTML tree and adds them to the queue if not visited.
     """
-    if not soup:
+    if not tree:
         return
 
-    for link in soup.find_all('a', href=True):
-        href = link['href']
-        full_url_obj = httpx.URL(current_url).join(href)
-        full_url = str(full_url_obj)
+    # Parse the page URL once and resolve every link against it
+    base_url = httpx.URL(current_url)
+    candidate_urls = []
 
-        normalized_full_url = normalize_url(full_url)
+    for link in tree.css('a[href]'):
+        href = link.attributes.get('href')
+        if not href:
+            continue
 
-        if get_domain(normalized_full_url) == base_domain and normalized_full_url not in visited_urls:
-            urls_to_visit.append(normalized_full_url)
+        try:
+            candidate_urls.append(str(base_url.join(href)))
+        except httpx.InvalidURL:
+            continue
+
+    # Normalize in bulk and drop duplicates on the page, keeping document order
+    normalized_urls = dict.fromkeys(normalize_url(url) for url in candidate_urls)
+
+    for normalized_full_url in normalized_urls:
+        if normalized_full_url not in visited_urls and get_domain(normalized_full_url) == base_domain:
+            urls_to_visit.put_nowait(normalized_full_url)
 
 
 async def crawl_website(start_url: str, url_dir: str) -> list[str]:
     """
     Crawls the website starting from start_url, scrapes all internal links,
     stores content locally, and returns a list of all scraped texts.
-    Handles both HTML and PDF content.
+    Handles both HTML and PDF content. Pages are fetched over plain HTTP by a pool
+    of concurrent workers and only rendered with Selenium when they appear to
+    require JavaScript.
     """
     base_domain = get_domain(start_url)
     visited_urls = set()
-    urls_to_visit = deque([start_url])
+    urls_to_visit: asyncio.Queue[str] = asyncio.Queue()
+    # Only normalized URLs are ever queued, so workers use them as-is
+    urls_to_visit.put_nowait(normalize_url(start_url))
     all_scraped_texts = []
 
-    driver = None
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+    async def fetch_page(client: httpx.AsyncClient, url: str) -> tuple[str, LexborHTMLParser | None, bool]:
+        """
+        Fetches a page without a browser. Returns the extracted text, the parsed page
+        and whether the page should be rendered with Selenium. The static text and
+        page are returned even then, so they can be used if rendering fails.
+        """
+        # Determine content type based on extension
+        extension = get_url_extension(url)
+
+        if extension == '.pdf':
+            print(f"Processing PDF document: {url}")
+            return await extract_text_from_pdf_url(url, client), None, False
+
+        elif extension in MEDIA_EXTENSIONS:
+            print(f"Skipping non-textual binary document: {url}")
+            return "", None, False
 
-    try:
-        driver = get_web_driver()
+        try:
+            content_type, html_content = await _fetch_html_page(client, url)
+        except httpx.HTTPStatusError as e:
+            status_code = e.response.status_code
 
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            is_separator_regex=False,
-        )
+            # Bot protection often rejects plain HTTP clients but lets a real browser through
+            if status_code in (403, 429):
+                print(f"HTTP {status_code} for {url}. Falling back to Selenium.")
+                return "", None, True
+
+            print(f"Skipping {url}: HTTP {status_code} {e.response.reason_phrase}")
+            return "", None, False
+
+        except httpx.HTTPError as e:
+            print(f"HTTP fetch failed for {url}: {e}. Falling back to Selenium.")
+            return "", None, True
 
-        # List of non-textual file extensions to explicitly skip
-        # PDFs are now handled, so removed from this list
-        media_extensions_to_skip = [
-            '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.webp',
-            '.mp4', '.mov', '.avi', '.wmv', '.flv', '.mkv',
-            '.mp3', '.wav', '.ogg', '.webm',
-            '.ico', '.zip', '.rar', '.tar', '.gz', '.doc', '.docx', '.ppt', '.xls'
-        ]
+        if "application/pdf" in content_type:
+            print(f"Processing PDF document: {url}")
+            return await extract_text_from_pdf_url(url, client), None, False
 
-        while urls_to_visit:
-            current_url = urls_to_visit.popleft()
-            normalized_current_url = normalize_url(current_url)
+        if not html_content:
+            print(f"Skipping non-HTML content ({content_type or 'unknown'}) for {url}")
+            return "", None, False
 
-            if normalized_current_url in visited_urls:
-                continue
+        tree = parse_html(html_content)
+        page_text = _extract_text_from_html(tree)
 
-            print(f"\nScraping: {current_url}")
-            visited_urls.add(normalized_current_url)
+        if _needs_js_rendering(tree, page_text):
+            print(f"Page {url} appears to require JavaScript. Rendering with Selenium.")
+            return page_text, tree, True
 
-            markdown = ""
-            soup: BeautifulSoup | None = None
+        return page_text, tree, False
 
-            # Determine content type based on extension
-            if any(normalized_current_url.lower().endswith(ext) for ext in media_extensions_to_skip):
-                print(f"Skipping non-textual binary document: {normalized_current_url}")
-                continue  # Skip to next URL in queue
+    async def worker(client: httpx.AsyncClient):
+        # The browser is only started if this worker meets a page that needs JavaScript rendering
+        driver = None
+        # Set once starting the browser fails, so it isn't retried for every later page
+        driver_failed = False
+
+        try:
+            while True:
+                current_url = await urls_to_visit.get()
 
-            elif normalized_current_url.lower().endswith('.pdf'):
-                print(f"Processing PDF document: {normalized_current_url}")
-                markdown = await extract_text_from_pdf_url(normalized_current_url)
+                try:
+                    # Check-and-add is atomic: there is no await between the two
+                    if current_url in visited_urls:
+                        continue
 
-            else:
-                # Assume HTML content for other URLs
-                soup = await asyncio.to_thread(_scrape_html_page, driver, current_url)
+                    print(f"\nScraping: {current_url}")
+                    visited_urls.add(current_url)
 
-                if not soup:
-                    print(f"Skipping empty content for {current_url}")
-                    continue
+                    page_text, tree, needs_rendering = await fetch_page(client, current_url)
 
-                markdown = _extract_text_from_html(soup)
+                    if needs_rendering and not driver_failed and driver is None:
+                        try:
+                            driver = await asyncio.to_thread(get_web_driver)
+                        except Exception as e:
+                            driver_failed = True
+                            print(f"Failed to start Selenium WebDriver: {e}. "
+                                  f"Using the statically fetched content instead.")
 
-            if not markdown.strip():
-                print(f"No meaningful text extracted from {current_url}. Skipping for embedding.")
-                continue
+                    if needs_rendering and driver:
+                        rendered_tree = await asyncio.to_thread(_scrape_html_page, driver, current_url)
 
-            _process_content_and_store(current_url, markdown, text_splitter, all_scraped_texts, url_dir)
+                        if rendered_tree:
+                            tree = rendered_tree
+                            page_text = _extract_text_from_html(tree)
+                        else:
+                            print(f"Rendering failed for {current_url}. Using the statically fetched content.")
+
+                    if not page_text.strip():
+                        print(f"No meaningful text extracted from {current_url}. Skipping for embedding.")
+                        continue
+
+                    await _process_content_and_store(current_url, page_text, text_splitter, all_scraped_texts, url_dir)
+
+                    # Extract links only from HTML pages (PDFs don't have navigable links in this context)
+                    if tree:
+                        _extract_and_queue_links(tree, current_url, base_domain, visited_urls, urls_to_visit)
+
+                except Exception as e:
+                    print(f"Error while crawling {current_url}: {e}")
+
+                finally:
+                    urls_to_visit.task_done()
+
+        finally:
+            # Ensure the browser is closed even if an error occurs
+            if driver:
+                await asyncio.to_thread(driver.quit)
+                print("Selenium WebDriver closed after crawling.")
+
+    workers = []
+
+    try:
+        async with get_http_client() as client:
+            workers = [asyncio.create_task(worker(client)) for _ in range(CRAWL_WORKERS)]
 
-            # Extract links only from HTML pages (PDFs don't have navigable links in this context)
-            if soup:
-                _extract_and_queue_links(soup, current_url, base_domain, visited_urls, urls_to_visit)
+            # The queue is drained once every visited page has queued its links
+            await urls_to_visit.join()
 
         print(f"\nFinished crawling. Scraped {len(all_scraped_texts)} pages.")
         return all_scraped_texts
@@ -180,10 +350,9 @@ async def crawl_website(start_url: str, url_dir: str) -> list[str]:
         raise
 
     finally:
-        # Ensure the browser is closed even if an error occurs
-        if driver:
-            driver.quit()
-            print("Selenium WebDriver closed after crawling.")
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
 
 
 async def read_all_scraped_pages_text(scrape_id: str) -> list[str]:
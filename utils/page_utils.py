@@ -1,9 +1,18 @@
 import os
 import re
 
+from selectolax.lexbor import LexborHTMLParser
+
 # Base directory for all scraped data and FAISS indexes
 BASE_SCRAPED_DATA_DIR = "scraped_pages"
 
+# Patterns used by slugify, compiled once at import
+_SLUG_STRIP = re.compile(r'[^\w\s-]')
+_SLUG_JOIN = re.compile(r'[-\s]+')
+
+# Elements that never carry page content and are dropped before text extraction
+_NON_CONTENT_SELECTOR = "script, style, head, img, svg, link, aside, form"
+
 def get_scrape_dir(scrape_id: str) -> str:
     """Returns the base directory for a specific scrape ID."""
     return os.path.join(BASE_SCRAPED_DATA_DIR, scrape_id)
@@ -20,14 +29,18 @@ def get_faiss_index_dir(scrape_id: str) -> str:
     """Returns the directory where the FAISS index for a scrape ID is stored."""
     return os.path.join(get_scrape_dir(scrape_id), "faiss_index")
 
-def clean_html_content(soup):
-    for tag in soup.find_all(["script", "style", "head", "img", "svg", "link", "aside", "form"]):
-        tag.decompose()
+def parse_html(html_content: str) -> LexborHTMLParser:
+    """Parses an HTML document with the C-based Lexbor HTML5 parser."""
+    return LexborHTMLParser(html_content)
+
+def clean_html_content(tree: LexborHTMLParser):
+    for node in tree.css(_NON_CONTENT_SELECTOR):
+        node.decompose()
 
-    body_content = soup.body
-    return body_content if body_content else soup
+    body_content = tree.body
+    return body_content if body_content else tree.root
 
 # Function to create a valid filename
 def slugify(text):
-    text = re.sub(r'[^\w\s-]', '', text)  # remove non-word characters
-    return re.sub(r'[-\s]+', '_', text).strip('_').lower()
+    text = _SLUG_STRIP.sub('', text)  # remove non-word characters
+    return _SLUG_JOIN.sub('_', text).strip('_').lower()
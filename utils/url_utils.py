@@ -1,8 +1,27 @@
+import asyncio
+import functools
+import os
 from urllib.parse import urlparse, parse_qs, urlencode
 
 import httpx
 import pymupdf
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
+
+# Browser-like user agent shared by the HTTP client and the Selenium driver
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+              "AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/124.0.0.0 Safari/537.36")
+
+# Non-textual file extensions that are never scraped (PDFs are handled separately)
+MEDIA_EXTENSIONS = frozenset({
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.webp',
+    '.mp4', '.mov', '.avi', '.wmv', '.flv', '.mkv',
+    '.mp3', '.wav', '.ogg', '.webm',
+    '.ico', '.zip', '.rar', '.tar', '.gz', '.doc', '.docx', '.ppt', '.xls'
+})
+
+# Largest PDF that will be downloaded for text extraction (50 MiB)
+MAX_PDF_BYTES = 50 * 1024 * 1024
 
 
 def get_domain(url: str) -> str:
@@ -17,6 +36,21 @@ def get_domain(url: str) -> str:
     except httpx.InvalidURL:
         return ""
 
+def get_url_extension(url: str) -> str:
+    """Returns the lowercased file extension of a URL's path (e.g. '.pdf'), or '' if it has none."""
+    return os.path.splitext(urlparse(url).path)[1].lower()
+
+def get_http_client() -> httpx.AsyncClient:
+    """Creates the async HTTP client shared by all page fetches of a crawl."""
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=64),
+        headers={"User-Agent": USER_AGENT},
+        follow_redirects=True,
+        timeout=30.0
+    )
+
+@functools.lru_cache(maxsize=1 << 17)
 def normalize_url(url: str) -> str:
     """Normalizes a URL for consistent comparison (removes fragments, sorts query params)."""
     try:
@@ -46,29 +80,21 @@ def normalize_url(url: str) -> str:
     except Exception:
         return url # Return original if invalid
 
-def get_all_urls(data: BeautifulSoup, domain: str):
+def get_all_urls(data: LexborHTMLParser, domain: str):
     urls = []
     seen = set()
     if data:
-        url_elements = data.select("a[href]")
+        url_elements = data.css("a[href]")
         for url_element in url_elements:
-            href = url_element['href'].split('?')[0]  # remove URL params
+            href = (url_element.attributes.get('href') or '').split('?')[0]  # remove URL params
             if href.endswith("/"):
                 href = href[:-1]
 
             if href.startswith("/"):
                 href = "https://" + domain + href
 
-            href_lower = href.lower()
-
             # Skip media files
-            media_extensions = (
-                '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.webp',
-                '.mp4', '.mov', '.avi', '.wmv', '.flv', '.mkv',
-                '.mp3', '.wav', '.ogg', '.webm',
-                '.ico', '.zip', '.rar', '.tar', '.gz', '.doc', '.docx', '.ppt', '.xls'
-            )
-            if any(href_lower.endswith(ext) for ext in media_extensions):
+            if get_url_extension(href) in MEDIA_EXTENSIONS:
                 continue
 
             if href.startswith("http://") or href.startswith("https://"):
@@ -91,28 +117,50 @@ def get_all_urls(data: BeautifulSoup, domain: str):
 
     return urls
 
-async def extract_text_from_pdf_url(url: str) -> str:
+def _parse_pdf(pdf_bytes: bytes) -> str:
+    """
+    Extracts all text from in-memory PDF bytes using pymupdf. This is a synchronous,
+    CPU-bound function.
+    """
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return "\n".join(page.get_text("text") for page in doc)
+
+async def _download_pdf(client: httpx.AsyncClient, url: str) -> bytes:
+    """
+    Streams a PDF into memory, aborting once it grows past MAX_PDF_BYTES.
+    """
+    async with client.stream("GET", url, timeout=60.0) as response:
+        response.raise_for_status()
+
+        pdf_bytes = bytearray()
+        async for chunk in response.aiter_bytes():
+            pdf_bytes += chunk
+            if len(pdf_bytes) > MAX_PDF_BYTES:
+                raise ValueError(f"PDF is larger than the {MAX_PDF_BYTES} byte download limit")
+
+    return bytes(pdf_bytes)
+
+async def extract_text_from_pdf_url(url: str, client: httpx.AsyncClient | None = None) -> str:
     """
     Downloads a PDF from a URL and extracts all text from it.
+    Reuses the given HTTP client when one is provided.
     """
     print(f"Attempting to extract text from PDF: {url}")
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, follow_redirects=True, timeout=60.0)
-            response.raise_for_status()
-            pdf_bytes = response.content
+        if client is None:
+            async with get_http_client() as own_client:
+                pdf_bytes = await _download_pdf(own_client, url)
+        else:
+            pdf_bytes = await _download_pdf(client, url)
 
-        text = ""
-        # Use pymupdf to read the PDF from bytes
-        with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
-            for page in doc:
-                text += page.get_text()
+        # Parse the PDF in a worker thread so the event loop stays free during extraction
+        text = await asyncio.to_thread(_parse_pdf, pdf_bytes)
 
         if not text.strip():
             print(f"No text extracted from PDF: {url}")
         return text
     except httpx.HTTPStatusError as e:
-        print(f"HTTP error downloading PDF {url}: {e.response.status_code} - {e.response.text}")
+        print(f"HTTP error downloading PDF {url}: {e.response.status_code} - {e.response.reason_phrase}")
         return ""
     except Exception as e:
         print(f"Error extracting text from PDF {url}: {e}")
@@ -4,6 +4,8 @@ from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.webdriver import WebDriver
 from webdriver_manager.chrome import ChromeDriverManager
 
+from utils.url_utils import USER_AGENT
+
 
 def get_web_driver() -> WebDriver:
     # Configure Chrome options for headless mode (no visible browser UI)
@@ -13,9 +15,7 @@ def get_web_driver() -> WebDriver:
     options.add_argument("--disable-dev-shm-usage")
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_argument("--window-size=1920,1080")
-    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                         "AppleWebKit/537.36 (KHTML, like Gecko) "
-                         "Chrome/124.0.0.0 Safari/537.36")
+    options.add_argument(f"user-agent={USER_AGENT}")
 
     # Initialize the Chrome WebDriver using ChromeDriverManager to automatically handle driver downloads
     service = Service(ChromeDriverManager().install())
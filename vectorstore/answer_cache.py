@@ -0,0 +1,106 @@
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+# Cosine similarity at or above which a cached answer is reused for a new query
+SIMILARITY_THRESHOLD = 0.93
+
+# Maximum number of cached answers kept per scrape_id (least recently used are evicted)
+MAX_ANSWERS_PER_SCRAPE = 1024
+
+
+class _ScrapeAnswerCache:
+    """
+    Cached answers for one scrape_id: an exact-match lookup on the normalized query
+    text plus an inner-product FAISS index over unit-length query embeddings.
+    """
+
+    def __init__(self, dimension: int):
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(dimension))
+        self.entries: OrderedDict[int, dict] = OrderedDict()
+        self.exact_ids: dict[str, int] = {}
+        self.next_id = 0
+
+
+# --- Global Cache for Answers ---
+# Stores cached answers, keyed by scrape_id
+answer_caches: dict[str, _ScrapeAnswerCache] = {}
+
+
+def _normalize_query(query: str) -> str:
+    """Normalizes case and whitespace so trivially different queries match exactly."""
+    return " ".join(query.lower().split())
+
+
+def _to_unit_vector(embedding: list[float]) -> np.ndarray:
+    """Converts an embedding into a (1, d) float32 array of unit length for cosine similarity."""
+    vector = np.asarray([embedding], dtype=np.float32)
+    faiss.normalize_L2(vector)
+    return vector
+
+
+def get_exact_cached_answer(scrape_id: str, query: str) -> dict | None:
+    """
+    Returns the cached answer for the same query (ignoring case and whitespace),
+    or None on a cache miss. Needs no embedding, so it is checked first.
+    """
+    cache = answer_caches.get(scrape_id)
+    if cache is None:
+        return None
+
+    entry_id = cache.exact_ids.get(_normalize_query(query))
+    if entry_id is None:
+        return None
+
+    cache.entries.move_to_end(entry_id)
+    return cache.entries[entry_id]["response"]
+
+
+def get_similar_cached_answer(scrape_id: str, query_embedding: list[float]) -> dict | None:
+    """
+    Returns the cached answer for a previous query whose embedding is at least
+    SIMILARITY_THRESHOLD similar to this one, or None on a cache miss.
+    """
+    cache = answer_caches.get(scrape_id)
+    if cache is None or not cache.entries:
+        return None
+
+    scores, ids = cache.index.search(_to_unit_vector(query_embedding), 1)
+    if ids[0][0] == -1 or scores[0][0] < SIMILARITY_THRESHOLD:
+        return None
+
+    entry_id = int(ids[0][0])
+    cache.entries.move_to_end(entry_id)
+    return cache.entries[entry_id]["response"]
+
+
+def store_answer(scrape_id: str, query: str, query_embedding: list[float], response: dict):
+    """
+    Caches the response generated for a query, evicting the least recently used
+    answer once the scrape_id holds MAX_ANSWERS_PER_SCRAPE entries.
+    """
+    cache = answer_caches.get(scrape_id)
+    if cache is None:
+        cache = answer_caches[scrape_id] = _ScrapeAnswerCache(len(query_embedding))
+
+    normalized_query = _normalize_query(query)
+    if normalized_query in cache.exact_ids:
+        return
+
+    entry_id = cache.next_id
+    cache.next_id += 1
+
+    cache.index.add_with_ids(_to_unit_vector(query_embedding), np.asarray([entry_id], dtype=np.int64))
+    cache.entries[entry_id] = {"query": normalized_query, "response": response}
+    cache.exact_ids[normalized_query] = entry_id
+
+    while len(cache.entries) > MAX_ANSWERS_PER_SCRAPE:
+        evicted_id, evicted = cache.entries.popitem(last=False)
+        cache.index.remove_ids(np.asarray([evicted_id], dtype=np.int64))
+        del cache.exact_ids[evicted["query"]]
+
+
+def invalidate_answer_cache(scrape_id: str):
+    """Drops all cached answers for a scrape_id, e.g. after its vector store is rebuilt."""
+    answer_caches.pop(scrape_id, None)
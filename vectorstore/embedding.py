@@ -1,53 +1,222 @@
 import os
 
 import asyncio
+import functools
+import math
+import weakref
+from collections import OrderedDict
 
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_openai import AzureOpenAIEmbeddings
 from pydantic import SecretStr
 
 from utils.page_utils import get_faiss_index_dir
+from vectorstore.answer_cache import invalidate_answer_cache
 
 
+# Tuning settings below are read from the environment when used rather than at
+# import, so values from the .env file (loaded after this module is imported) apply.
+#   EMBEDDING_BATCH_SIZE  text chunks sent to the embeddings API per request
+#                         (default: the embeddings client's own batch size)
+#   FAISS_EF_SEARCH       HNSW query-time search depth (default 64)
+#   FAISS_NPROBE          IVF clusters visited per query (default 16)
+#   FAISS_QUANTIZE=sq8    store vectors as 8-bit scalars (~4x less memory, small recall cost)
+
+# HNSW graph parameters: neighbours per node and build-time search depth
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+
+# Indexes with at least this many vectors use IVF clustering instead of an HNSW graph
+IVF_MIN_VECTORS = 100_000
+
+# GPU memory/stream resources shared by all GPU indexes, created on first use
+_gpu_resources = None
+
 # --- Global Cache for Vector Stores ---
-# Stores loaded FAISS vector store instances, keyed by scrape_id
-vector_store_cache = {}
+# Stores loaded FAISS vector store instances, keyed by scrape_id.
+# Least recently used entries are evicted once the cache is full.
+VECTOR_STORE_CACHE_SIZE = 32
+vector_store_cache: OrderedDict[str, FAISS] = OrderedDict()
 
+# One lock per scrape_id, so concurrent queries load a vector store from disk only once
+# without a cold load of one scrape_id holding up cache hits for the others.
+# The cache itself is only touched synchronously (no await), so it needs no lock.
+_scrape_id_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
 
-async def create_and_save_vector_store(texts: list[str], scrape_id: str):
+
+@functools.cache
+def get_embeddings() -> AzureOpenAIEmbeddings:
     """
-    Creates a FAISS vector store from text chunks and saves it locally
-    for a specific scrape_id.
+    Returns the OpenAI Embeddings model shared by index creation and loading
+    (the same model must be used for both).
     """
     # Ensure OpenAI API key is available
     api_key = os.getenv("API_KEY")
     if not api_key:
         raise ValueError("API_KEY environment variable not set.")
 
-    faiss_index_dir = get_faiss_index_dir(scrape_id)
-    os.makedirs(faiss_index_dir, exist_ok=True)
-
-    # Initialize OpenAI Embeddings model
     # This model converts text into numerical vector representations.
-    embeddings = AzureOpenAIEmbeddings(
+    return AzureOpenAIEmbeddings(
         azure_deployment=os.getenv("MODEL_NAME"),
         azure_endpoint=os.getenv("MODEL_URL"),
         api_version=os.getenv("MODEL_VERSION"),
         api_key=SecretStr(api_key)
     )
 
+
+def _get_scrape_id_lock(scrape_id: str) -> asyncio.Lock:
+    """Returns the lock serializing loads and rebuilds of a scrape_id's vector store."""
+    lock = _scrape_id_locks.get(scrape_id)
+    if lock is None:
+        lock = _scrape_id_locks[scrape_id] = asyncio.Lock()
+    return lock
+
+
+def _get_cached_vector_store(scrape_id: str) -> FAISS | None:
+    """Returns the cached vector store for a scrape_id, marking it most recently used."""
+    vectorstore = vector_store_cache.get(scrape_id)
+    if vectorstore is not None:
+        vector_store_cache.move_to_end(scrape_id)
+    return vectorstore
+
+
+def _cache_vector_store(scrape_id: str, vectorstore: FAISS):
+    """
+    Stores a vector store as the most recently used cache entry, evicting the
+    least recently used one when the cache is full.
+    """
+    vector_store_cache[scrape_id] = vectorstore
+    vector_store_cache.move_to_end(scrape_id)
+
+    while len(vector_store_cache) > VECTOR_STORE_CACHE_SIZE:
+        evicted_id, _ = vector_store_cache.popitem(last=False)
+        # Answers are only cached for loaded vector stores, so both caches stay bounded
+        invalidate_answer_cache(evicted_id)
+        print(f"Vector store for scrape_id {evicted_id} evicted from cache.")
+
+
+def is_current_vector_store(scrape_id: str, vectorstore: FAISS) -> bool:
+    """
+    Returns whether the vector store is still the loaded one for the scrape_id,
+    i.e. it has not been rebuilt or evicted from the cache since it was loaded.
+    """
+    return vector_store_cache.get(scrape_id) is vectorstore
+
+
+def _create_faiss_index(vectors: np.ndarray) -> faiss.Index:
+    """
+    Creates an empty approximate nearest-neighbour FAISS index for the given (N, d)
+    embedding matrix: an HNSW graph, or IVF clusters trained on the vectors for
+    very large scrapes. Vectors are stored as 8-bit scalars when FAISS_QUANTIZE=sq8.
+    This is a synchronous, CPU-bound function.
+    """
+    num_vectors, dimension = vectors.shape
+    quantize = os.getenv("FAISS_QUANTIZE", "").lower() == "sq8"
+
+    if num_vectors >= IVF_MIN_VECTORS:
+        nlist = int(4 * math.sqrt(num_vectors))
+        index = faiss.index_factory(dimension, f"IVF{nlist},{'SQ8' if quantize else 'Flat'}")
+    else:
+        index = faiss.index_factory(dimension, f"HNSW{HNSW_M},SQ8" if quantize else f"HNSW{HNSW_M}")
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+
+    # IVF centroids and the scalar quantizer's value ranges are learned from the corpus
+    if not index.is_trained:
+        index.train(vectors)
+
+    _set_search_params(index)
+    return index
+
+
+def _set_search_params(index: faiss.Index):
+    """
+    Applies the configured query-time accuracy/speed knobs, so they can be tuned
+    without rebuilding saved indexes.
+    """
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = int(os.getenv("FAISS_EF_SEARCH", "64"))
+
+    ivf_index = faiss.try_extract_index_ivf(index)
+    if ivf_index is not None:
+        ivf_index.nprobe = int(os.getenv("FAISS_NPROBE", "16"))
+
+
+def _move_index_to_gpu(index: faiss.Index) -> faiss.Index:
+    """
+    Moves a FAISS index to the first GPU when a GPU build of FAISS finds one.
+    The CPU index is returned unchanged when no GPU is available or the index
+    type has no GPU implementation (e.g. HNSW).
+    """
+    global _gpu_resources
+
+    if faiss.get_num_gpus() == 0:
+        return index
+
+    try:
+        if _gpu_resources is None:
+            _gpu_resources = faiss.StandardGpuResources()
+        return faiss.index_cpu_to_gpu(_gpu_resources, 0, index)
+    except Exception as e:
+        print(f"Keeping FAISS index on CPU: {e}")
+        return index
+
+
+async def _build_vector_store(texts: list[str], embeddings: AzureOpenAIEmbeddings) -> FAISS:
+    """
+    Embeds all text chunks (in batches of EMBEDDING_BATCH_SIZE when set) and adds
+    them to a new FAISS index with a single bulk add.
+    """
+    batch_size_setting = os.getenv("EMBEDDING_BATCH_SIZE")
+    batch_size = int(batch_size_setting) if batch_size_setting else None
+
+    vectors = np.asarray(
+        await embeddings.aembed_documents(texts, chunk_size=batch_size),
+        dtype=np.float32
+    )
+
+    vectorstore = FAISS(
+        embedding_function=embeddings,
+        index=await asyncio.to_thread(_create_faiss_index, vectors),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={}
+    )
+    await asyncio.to_thread(vectorstore.add_embeddings, zip(texts, vectors))
+    return vectorstore
+
+
+async def create_and_save_vector_store(texts: list[str], scrape_id: str):
+    """
+    Creates a FAISS vector store from text chunks and saves it locally
+    for a specific scrape_id.
+    """
+    embeddings = get_embeddings()
+
+    faiss_index_dir = get_faiss_index_dir(scrape_id)
+    os.makedirs(faiss_index_dir, exist_ok=True)
+
     # Create a FAISS vector store from the text chunks and their embeddings.
     # FAISS is an efficient library for similarity search.
-    vectorstore = await asyncio.to_thread(FAISS.from_texts, texts, embeddings)
+    vectorstore = await _build_vector_store(texts, embeddings)
 
-    # Save the FAISS index locally. This creates two files:
-    # 1. db_path/index.faiss (the FAISS index itself)
-    # 2. db_path/index.pkl (metadata, including the texts and embeddings)
-    await asyncio.to_thread(vectorstore.save_local, faiss_index_dir)
-    print(f"Vector store successfully created and saved for scrape_id {scrape_id} to {faiss_index_dir}")
+    # Hold the scrape_id lock so a concurrent load never reads a half-written index
+    async with _get_scrape_id_lock(scrape_id):
+        # Save the FAISS index locally. This creates two files:
+        # 1. db_path/index.faiss (the FAISS index itself)
+        # 2. db_path/index.pkl (metadata, including the texts and embeddings)
+        await asyncio.to_thread(vectorstore.save_local, faiss_index_dir)
+        print(f"Vector store successfully created and saved for scrape_id {scrape_id} to {faiss_index_dir}")
 
-    # Store the newly created vector store in the cache
-    vector_store_cache[scrape_id] = vectorstore
+        # Only the saved copy has to stay on CPU; searches can run on the GPU
+        vectorstore.index = await asyncio.to_thread(_move_index_to_gpu, vectorstore.index)
+
+        # Replace any cached copy of the previous index with the newly created vector store
+        _cache_vector_store(scrape_id, vectorstore)
+
+    # Answers cached for the previous index may no longer match the new content
+    invalidate_answer_cache(scrape_id)
 
 
 async def load_vector_store(scrape_id: str):
@@ -56,35 +225,35 @@ async def load_vector_store(scrape_id: str):
     Checks the global cache first.
     """
     # Check cache first
-    if scrape_id in vector_store_cache:
+    vectorstore = _get_cached_vector_store(scrape_id)
+    if vectorstore is not None:
         print(f"Vector store for scrape_id {scrape_id} loaded from cache.")
-        return vector_store_cache[scrape_id]
+        return vectorstore
 
-    faiss_index_dir = get_faiss_index_dir(scrape_id)
-    if not os.path.exists(faiss_index_dir):
-        raise FileNotFoundError(f"FAISS index for scrape_id {scrape_id} not found at {faiss_index_dir}")
+    async with _get_scrape_id_lock(scrape_id):
+        # Another request may have loaded it while this one waited for the lock
+        vectorstore = _get_cached_vector_store(scrape_id)
+        if vectorstore is not None:
+            print(f"Vector store for scrape_id {scrape_id} loaded from cache.")
+            return vectorstore
 
-    # Ensure OpenAI API key is available
-    api_key = os.getenv("API_KEY")
-    if not api_key:
-        raise ValueError("API_KEY environment variable not set.")
+        faiss_index_dir = get_faiss_index_dir(scrape_id)
+        if not os.path.exists(faiss_index_dir):
+            raise FileNotFoundError(f"FAISS index for scrape_id {scrape_id} not found at {faiss_index_dir}")
 
-    # Initialize OpenAI Embeddings model (must be the same model used for creation)
-    embeddings = AzureOpenAIEmbeddings(
-        azure_deployment=os.getenv("MODEL_NAME"),
-        azure_endpoint=os.getenv("MODEL_URL"),
-        api_version=os.getenv("MODEL_VERSION"),
-        api_key=SecretStr(api_key)
-    )
+        # Must be the same embeddings model used for creation
+        embeddings = get_embeddings()
 
-    # Load the FAISS index from the specified path.
-    # allow_dangerous_deserialization=True is necessary for loading pickle files
-    # generated by older versions or from untrusted sources. Use with caution.
-    vectorstore = await asyncio.to_thread(
-        FAISS.load_local, faiss_index_dir, embeddings, allow_dangerous_deserialization=True
-    )
-    print(f"Vector store successfully loaded for scrape_id {scrape_id} from {faiss_index_dir}")
+        # Load the FAISS index from the specified path.
+        # allow_dangerous_deserialization=True is necessary for loading pickle files
+        # generated by older versions or from untrusted sources. Use with caution.
+        vectorstore = await asyncio.to_thread(
+            FAISS.load_local, faiss_index_dir, embeddings, allow_dangerous_deserialization=True
+        )
+        _set_search_params(vectorstore.index)
+        vectorstore.index = await asyncio.to_thread(_move_index_to_gpu, vectorstore.index)
+        print(f"Vector store successfully loaded for scrape_id {scrape_id} from {faiss_index_dir}")
 
-    # Store in cache for future use
-    vector_store_cache[scrape_id] = vectorstore
-    return vectorstore
+        # Store in cache for future use
+        _cache_vector_store(scrape_id, vectorstore)
+        return vectorstore
@@ -0,0 +1,107 @@
+import asyncio
+import contextlib
+import threading
+import weakref
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+# How long the first query of a batch waits for concurrent queries to join it
+BATCH_WINDOW_SECONDS = 0.005
+
+# Number of documents retrieved per query (same as LangChain's retriever default)
+TOP_K = 4
+
+# GPU indexes share one set of GPU resources, which is not thread-safe, so their
+# searches run one at a time. CPU indexes are searched concurrently.
+_gpu_search_lock = threading.Lock()
+
+
+class _QueryBatcher:
+    """
+    Coalesces queries that arrive within BATCH_WINDOW_SECONDS of each other into a
+    single FAISS batch search and fans the results back out to each caller.
+    """
+
+    def __init__(self):
+        self.pending: list[tuple[list[float], asyncio.Future]] = []
+        self.flush_task: asyncio.Task | None = None
+
+    async def search(self, vectorstore: FAISS, embedding: list[float]) -> list[Document]:
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((embedding, future))
+
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_after_window(vectorstore))
+
+        return await future
+
+    async def _flush_after_window(self, vectorstore: FAISS):
+        await asyncio.sleep(BATCH_WINDOW_SECONDS)
+
+        batch, self.pending = self.pending, []
+        self.flush_task = None
+
+        try:
+            results = await asyncio.to_thread(_search_batch, vectorstore, [embedding for embedding, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), docs in zip(batch, results):
+            # The caller may have gone away (e.g. client disconnected) while waiting
+            if not future.done():
+                future.set_result(docs)
+
+
+def _is_gpu_index(index: faiss.Index) -> bool:
+    """Returns whether the index lives on a GPU (CPU-only FAISS builds have no GpuIndex)."""
+    gpu_index_type = getattr(faiss, "GpuIndex", None)
+    return gpu_index_type is not None and isinstance(index, gpu_index_type)
+
+
+def _search_batch(vectorstore: FAISS, embeddings: list[list[float]]) -> list[list[Document]]:
+    """
+    Runs one FAISS search for a (B, d) matrix of query embeddings and maps the hits
+    back to documents. This is a synchronous function.
+    """
+    query_vectors = np.asarray(embeddings, dtype=np.float32)
+
+    with _gpu_search_lock if _is_gpu_index(vectorstore.index) else contextlib.nullcontext():
+        _, indices = vectorstore.index.search(query_vectors, TOP_K)
+
+    results = []
+    for row in indices:
+        docs = []
+        for i in row:
+            # FAISS pads with -1 when the index holds fewer than TOP_K vectors
+            if i == -1:
+                continue
+            doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+            if isinstance(doc, Document):
+                docs.append(doc)
+        results.append(docs)
+
+    return results
+
+
+# --- Query Batchers ---
+# One batcher per loaded vector store; dropped together with the store when it
+# is evicted from the vector store cache or replaced by a rebuild
+_batchers: weakref.WeakKeyDictionary[FAISS, _QueryBatcher] = weakref.WeakKeyDictionary()
+
+
+async def batched_similarity_search(vectorstore: FAISS, embedding: list[float]) -> list[Document]:
+    """
+    Returns the TOP_K documents closest to the query embedding. Concurrent calls on
+    the same vector store are served by a single batched FAISS search.
+    """
+    batcher = _batchers.get(vectorstore)
+    if batcher is None:
+        batcher = _batchers[vectorstore] = _QueryBatcher()
+
+    return await batcher.search(vectorstore, embedding)